@@ -5,11 +5,11 @@ Account manager for handling multiple Telegram sessions
 import asyncio
 import logging
 import os
-from typing import Dict, List, Optional
+from typing import Dict, ItemsView, List, Optional, Tuple
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
-from config import API_ID, API_HASH, SESSION_DIR
-from database import DatabaseManager
+from config import API_ID, API_HASH, SESSION_DIR, CONNECTION_RETRIES, RETRY_DELAY, PENDING_SESSION_TTL
+from database import DatabaseManager, canonical_phone
 
 logger = logging.getLogger(__name__)
 
@@ -17,27 +17,73 @@ class AccountManager:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
         self.clients: Dict[str, TelegramClient] = {}
-        self.pending_sessions: Dict[str, TelegramClient] = {}
+        # Pending sign-ins expire after PENDING_SESSION_TTL seconds
+        self.pending_sessions: Dict[str, Tuple[TelegramClient, asyncio.TimerHandle]] = {}
     
     def get_session_path(self, phone_number: str) -> str:
         """Get the session file path for a phone number"""
-        clean_phone = phone_number.replace('+', '').replace('-', '').replace(' ', '')
-        return os.path.join(SESSION_DIR, f"session_{clean_phone}")
+        return os.path.join(SESSION_DIR, f"session_{canonical_phone(phone_number)[1:]}")
+    
+    def get_or_create_client(self, phone_number: str, session_name: str = None) -> TelegramClient:
+        """Get the shared client for a phone number, creating it only once"""
+        phone_number = canonical_phone(phone_number)
+        client = self.clients.get(phone_number)
+        if client is None and phone_number in self.pending_sessions:
+            client = self.pending_sessions[phone_number][0]
+        if client is None:
+            client = TelegramClient(
+                session_name or self.get_session_path(phone_number), API_ID, API_HASH,
+                connection_retries=CONNECTION_RETRIES,
+                retry_delay=RETRY_DELAY,
+                auto_reconnect=True
+            )
+        return client
+    
+    def _pop_pending(self, phone_number: str) -> Optional[TelegramClient]:
+        """Remove a pending session and cancel its expiry timer"""
+        entry = self.pending_sessions.pop(phone_number, None)
+        if entry is None:
+            return None
+        client, timer = entry
+        timer.cancel()
+        return client
+    
+    def _expire_pending(self, phone_number: str):
+        """Disconnect a pending session that was never verified"""
+        client = self._pop_pending(phone_number)
+        if client is not None:
+            logger.info(f"Pending session for {phone_number} expired")
+            asyncio.ensure_future(client.disconnect())
     
     async def add_new_account(self, phone_number: str) -> tuple[bool, str]:
         """Add a new account and send verification code"""
+        phone_number = canonical_phone(phone_number)
         try:
             session_name = self.get_session_path(phone_number)
             
-            # Create new client
-            client = TelegramClient(session_name, API_ID, API_HASH)
-            await client.connect()
+            # Reuse the existing client for this number if there is one
+            client = self.get_or_create_client(phone_number, session_name)
+            if not client.is_connected():
+                await client.connect()
+            
+            # An already authorized session does not need a new code
+            if await client.is_user_authorized():
+                self._pop_pending(phone_number)
+                self.clients[phone_number] = client
+                self.db.add_account(phone_number, session_name)
+                self.db.activate_account(phone_number)
+                logger.info(f"Reused authorized session for {phone_number}")
+                return True, f"Sessione già autorizzata per {phone_number}. Account attivato."
             
             # Send code request
             result = await client.send_code_request(phone_number)
             
-            # Store pending session
-            self.pending_sessions[phone_number] = client
+            # Store pending session, restarting its expiry timer
+            self._pop_pending(phone_number)
+            timer = asyncio.get_running_loop().call_later(
+                PENDING_SESSION_TTL, self._expire_pending, phone_number
+            )
+            self.pending_sessions[phone_number] = (client, timer)
             
             # Add to database
             self.db.add_account(phone_number, session_name)
@@ -51,11 +97,12 @@ class AccountManager:
     
     async def verify_code(self, phone_number: str, code: str) -> tuple[bool, str]:
         """Verify the code for a pending account"""
+        phone_number = canonical_phone(phone_number)
         if phone_number not in self.pending_sessions:
             return False, "Nessuna sessione in attesa per questo numero. Usa prima il comando .new"
         
         try:
-            client = self.pending_sessions[phone_number]
+            client, _ = self.pending_sessions[phone_number]
             
             # Sign in with code
             await client.sign_in(phone_number, code)
@@ -67,7 +114,7 @@ class AccountManager:
             self.clients[phone_number] = client
             
             # Remove from pending
-            del self.pending_sessions[phone_number]
+            self._pop_pending(phone_number)
             
             # Activate in database
             self.db.activate_account(phone_number)
@@ -85,28 +132,57 @@ class AccountManager:
             logger.error(f"Error verifying code for {phone_number}: {e}")
             return False, f"Error: {str(e)}"
     
+    async def remove_account(self, phone_number: str) -> tuple[bool, str]:
+        """Disconnect an active account and stop using it"""
+        phone_number = canonical_phone(phone_number)
+        client = self.clients.pop(phone_number, None)
+        if client is None:
+            return False, f"Account {phone_number} non trovato o non attivo"
+        
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error(f"Error disconnecting client {phone_number}: {e}")
+        
+        # Deactivate in database
+        self.db.deactivate_account(phone_number)
+        
+        logger.info(f"Account {phone_number} removed from monitoring")
+        return True, f"Account {phone_number} rimosso dal monitoraggio e disconnesso"
+    
+    async def _load_one(self, account: Dict):
+        """Connect a single stored session and register it if authorized"""
+        phone = canonical_phone(account['phone'])
+        try:
+            client = self.get_or_create_client(phone, account['session'])
+            if not client.is_connected():
+                await client.connect()
+            
+            if await client.is_user_authorized():
+                self.clients[phone] = client
+                logger.info(f"Loaded session for {phone}")
+            else:
+                logger.warning(f"Session for {phone} is not authorized")
+                
+        except Exception as e:
+            logger.error(f"Error loading session for {phone}: {e}")
+    
     async def load_existing_sessions(self):
         """Load all existing active sessions"""
         accounts = self.db.get_active_accounts()
         
-        for account in accounts:
-            try:
-                client = TelegramClient(account['session'], API_ID, API_HASH)
-                await client.connect()
-                
-                if await client.is_user_authorized():
-                    self.clients[account['phone']] = client
-                    logger.info(f"Loaded session for {account['phone']}")
-                else:
-                    logger.warning(f"Session for {account['phone']} is not authorized")
-                    
-            except Exception as e:
-                logger.error(f"Error loading session for {account['phone']}: {e}")
+        # Connect all sessions concurrently, each one only touches its own key
+        await asyncio.gather(*[self._load_one(account) for account in accounts],
+                             return_exceptions=True)
     
     def get_active_clients(self) -> Dict[str, TelegramClient]:
-        """Get all active clients"""
+        """Get a snapshot of all active clients"""
         return self.clients.copy()
     
+    def iter_active_clients(self) -> ItemsView[str, TelegramClient]:
+        """Get a live (phone, client) view of active clients without copying"""
+        return self.clients.items()
+    
     def get_client_list(self) -> List[str]:
         """Get list of active client phone numbers"""
         return list(self.clients.keys())
@@ -120,7 +196,8 @@ class AccountManager:
             except Exception as e:
                 logger.error(f"Error disconnecting client: {e}")
         
-        for client in self.pending_sessions.values():
+        for client, timer in self.pending_sessions.values():
+            timer.cancel()
             try:
                 if hasattr(client, 'disconnect'):
                     await client.disconnect()
@@ -129,3 +206,6 @@ class AccountManager:
         
         self.clients.clear()
         self.pending_sessions.clear()
+
+        # Persist any pending database changes
+        await self.db.flush_async()
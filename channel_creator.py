@@ -3,25 +3,111 @@ Channel creator for sniped usernames
 """
 
 import asyncio
+import functools
 import logging
-from typing import Optional
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
 from telethon import TelegramClient
 from telethon.errors import UsernameOccupiedError, FloodWaitError
-from telethon.tl.functions.channels import CreateChannelRequest, UpdateUsernameRequest, DeleteChannelRequest
-from config import CHANNEL_TITLE_TEMPLATE, CHANNEL_MESSAGE
+from config import CHANNEL_TITLE_TEMPLATE, CHANNEL_MESSAGE, REQUEST_RATE, REQUEST_BURST
 
 logger = logging.getLogger(__name__)
 
+@functools.cache
+def _get_requests():
+    """Import the TL request types on first use instead of at module import"""
+    from telethon.tl.functions.channels import (
+        CreateChannelRequest, UpdateUsernameRequest, DeleteChannelRequest, CheckUsernameRequest
+    )
+    from telethon.tl.types import InputChannelEmpty
+    return CreateChannelRequest, UpdateUsernameRequest, DeleteChannelRequest, CheckUsernameRequest, InputChannelEmpty
+
+@dataclass
+class SnipeResult:
+    """Outcome of trying to claim a username with the available accounts"""
+    success: bool
+    message: str
+    channel_link: str = ""
+    account: Optional[str] = None
+
+class RateLimiter:
+    """Per-account token bucket that paces requests before they reach Telegram"""
+    
+    def __init__(self, rate: float = REQUEST_RATE, capacity: float = REQUEST_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+    
+    async def acquire(self, key: str, cost: float = 1, stop: Optional[asyncio.Event] = None) -> bool:
+        """Wait until the bucket has enough tokens, then consume them
+
+        Returns False without consuming anything if ``stop`` is set while waiting,
+        so a flood-waited account does not hold up a race that is already over.
+        """
+        while True:
+            if stop is not None and stop.is_set():
+                return False
+            
+            now = time.monotonic()
+            tokens, last_refill = self.buckets.get(key, (self.capacity, now))
+            
+            # A refill time in the future means the account is flood-waited
+            if now > last_refill:
+                tokens = min(self.capacity, tokens + (now - last_refill) * self.rate)
+                last_refill = now
+            
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, last_refill)
+                return True
+            
+            self.buckets[key] = (tokens, last_refill)
+            delay = max(last_refill - now, 0) + (cost - tokens) / self.rate
+            if stop is None:
+                await asyncio.sleep(delay)
+                continue
+            
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def penalize(self, key: str, seconds: float):
+        """Empty the bucket and hold refills until a flood wait expires"""
+        self.buckets[key] = (0.0, time.monotonic() + seconds)
+
 class ChannelCreator:
     def __init__(self):
-        pass
+        self.limiter = RateLimiter()
     
-    async def create_channel(self, client: TelegramClient, username: str) -> tuple[bool, str]:
-        """Create a channel with the sniped username"""
+    async def _claim_username(self, client: TelegramClient, username: str, phone: str,
+                              stop: Optional[asyncio.Event] = None) -> tuple[bool, str, object]:
+        """Create a channel and assign the username to it, returning (success, message, channel)
+        
+        Requests are never cancelled mid-flight: once ``stop`` is set the attempt
+        gives up instead of waiting for its next request and deletes the channel
+        it created.
+        """
+        (CreateChannelRequest, UpdateUsernameRequest, DeleteChannelRequest,
+         CheckUsernameRequest, InputChannelEmpty) = _get_requests()
+        stopped = f"❌ Tentativo annullato, @{username} è già stato preso da un altro account"
+        
         try:
             logger.info(f"Creating channel for username: @{username}")
             
+            # Make sure the username can still be assigned before creating anything
+            if not await self.limiter.acquire(phone, stop=stop):
+                return False, stopped, None
+            if not await client(CheckUsernameRequest(
+                channel=InputChannelEmpty(),
+                username=username
+            )):
+                logger.warning(f"Username @{username} is no longer available")
+                return False, f"❌ Username @{username} non più disponibile", None
+            
             # Create the channel
+            if not await self.limiter.acquire(phone, stop=stop):
+                return False, stopped, None
             result = await client(CreateChannelRequest(
                 title=CHANNEL_TITLE_TEMPLATE,
                 about="",  # Empty description as requested
@@ -33,6 +119,11 @@ class ChannelCreator:
             
             # Try to set the username
             try:
+                if not await self.limiter.acquire(phone, stop=stop):
+                    # Another account won the race, clean up the unused channel
+                    await client(DeleteChannelRequest(channel=channel))
+                    return False, stopped, None
+                
                 await client(UpdateUsernameRequest(
                     channel=channel,
                     username=username
@@ -40,12 +131,7 @@ class ChannelCreator:
                 
                 logger.info(f"✅ Successfully set username @{username} for channel")
                 
-                # Send the required message
-                await client.send_message(channel, CHANNEL_MESSAGE)
-                
-                logger.info(f"🎯 CHANNEL CREATED: @{username}")
-                
-                return True, f"✅ Canale creato con successo!\nTitolo: {CHANNEL_TITLE_TEMPLATE}\nUsername: @{username}\nMessaggio inviato: {CHANNEL_MESSAGE}"
+                return True, f"✅ Canale creato con successo!\nTitolo: {CHANNEL_TITLE_TEMPLATE}\nUsername: @{username}\nMessaggio inviato: {CHANNEL_MESSAGE}", channel
                 
             except UsernameOccupiedError:
                 # Username was taken between check and creation
@@ -54,41 +140,80 @@ class ChannelCreator:
                 # Delete the channel since we couldn't set the username
                 await client(DeleteChannelRequest(channel=channel))
                 
-                return False, f"❌ Username @{username} è stato preso durante la creazione"
+                return False, f"❌ Username @{username} è stato preso durante la creazione", None
                 
             except Exception as e:
                 logger.error(f"Error setting username for channel: {e}")
                 
+                if isinstance(e, FloodWaitError):
+                    self.limiter.penalize(phone, e.seconds)
+                
                 # Try to delete the channel
                 try:
                     await client(DeleteChannelRequest(channel=channel))
                 except:
                     pass
                 
-                return False, f"❌ Errore nell'impostare username: {str(e)}"
+                return False, f"❌ Errore nell'impostare username: {str(e)}", None
                 
         except FloodWaitError as e:
             logger.warning(f"Flood wait error when creating channel: {e.seconds} seconds")
-            return False, f"❌ Limite di velocità raggiunto. Aspetta {e.seconds} secondi."
+            self.limiter.penalize(phone, e.seconds)
+            return False, f"❌ Limite di velocità raggiunto. Aspetta {e.seconds} secondi.", None
             
         except Exception as e:
             logger.error(f"Error creating channel for @{username}: {e}")
-            return False, f"❌ Errore nella creazione del canale: {str(e)}"
+            return False, f"❌ Errore nella creazione del canale: {str(e)}", None
     
-    async def create_channel_with_fallback(self, clients: dict, username: str) -> tuple[bool, str, str]:
-        """Try to create channel with multiple clients as fallback"""
-        for phone, client in clients.items():
-            try:
-                success, message = await self.create_channel(client, username)
-                if success:
-                    channel_link = f"https://t.me/{username}"
-                    return True, f"Canale creato usando {phone}: {message}", channel_link
-                else:
-                    logger.warning(f"Failed to create channel with {phone}: {message}")
-                    continue
+    async def _send_channel_message(self, client: TelegramClient, channel, username: str):
+        """Post the required message in a channel that already owns the username"""
+        try:
+            # Not rate limited, a single message must not delay the claimed channel
+            await client.send_message(channel, CHANNEL_MESSAGE)
+            logger.info(f"🎯 CHANNEL CREATED: @{username}")
+        except Exception as e:
+            # The username is claimed either way, keep the channel
+            logger.error(f"Error sending message to claimed channel: {e}")
+    
+    async def create_channel_with_fallback(self, clients: Iterable[Tuple[str, TelegramClient]],
+                                           username: str) -> SnipeResult:
+        """Race channel creation across all (phone, client) pairs, keeping the first success"""
+        stop = asyncio.Event()
+        tasks = {asyncio.create_task(self._claim_username(client, username, phone, stop)): (phone, client)
+                 for phone, client in clients}
+        pending = set(tasks)
+        winner = None
+        
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    phone, client = tasks[task]
+                    try:
+                        success, message, channel = task.result()
+                    except Exception as e:
+                        logger.error(f"Error using client {phone}: {e}")
+                        continue
                     
-            except Exception as e:
-                logger.error(f"Error using client {phone}: {e}")
-                continue
+                    if not success:
+                        logger.warning(f"Failed to create channel with {phone}: {message}")
+                    elif winner is None:
+                        winner = (phone, client, message, channel)
+                        stop.set()
+            
+            # The username is already ours, the message no longer races anything
+            if winner:
+                phone, client, message, channel = winner
+                await self._send_channel_message(client, channel, username)
+        finally:
+            # Let the other attempts finish their in-flight request and clean up
+            stop.set()
+            if pending:
+                await asyncio.shield(asyncio.gather(*pending, return_exceptions=True))
+        
+        if winner:
+            channel_link = f"https://t.me/{username}"
+            return SnipeResult(True, f"Canale creato usando {phone}: {message}", channel_link, phone)
         
-        return False, "❌ Impossibile creare il canale con tutti gli account disponibili", ""
+        return SnipeResult(False, "❌ Impossibile creare il canale con tutti gli account disponibili")
@@ -15,7 +15,11 @@ MAX_ACCOUNTS = 50           # maximum number of accounts to manage
 
 # Session storage
 SESSION_DIR = "sessions"
+CONNECTION_RETRIES = 5      # reconnection attempts before a client gives up
+RETRY_DELAY = 1             # seconds between reconnection attempts
+PENDING_SESSION_TTL = 300   # seconds before an unverified sign-in is dropped
 # Database replaced with JSON files in data/ directory
+DB_FLUSH_INTERVAL = 2       # seconds between lazy writes of modified JSON files
 
 # Channel creation settings
 CHANNEL_TITLE_TEMPLATE = "sniped by @stabbato"
@@ -26,6 +30,11 @@ MIN_CHECK_INTERVAL = 5      # minimum seconds between checks
 MAX_CHECK_INTERVAL = 300    # maximum seconds between checks
 MIN_PAIR_DELAY = 10         # minimum seconds between pairs
 MAX_PAIR_DELAY = 600        # maximum seconds between pairs
+MAX_CONCURRENT_CHECKS = 8   # username checks in flight per account
+REQUEST_RATE = 0.5          # requests per second allowed per account
+REQUEST_BURST = 3           # requests an idle account can send at once (one full claim)
+MAX_HOT_USERNAMES = 10      # usernames that can be raced across all accounts
+HOT_CHECK_TIMEOUT = 10      # seconds to wait for every account when racing a username
 
 # Ensure session directory exists
 os.makedirs(SESSION_DIR, exist_ok=True)
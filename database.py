@@ -2,24 +2,71 @@
 JSON-based data manager for storing accounts, usernames, and configuration
 """
 
+import asyncio
+import heapq
 import json
 import logging
 import os
+import sys
+from collections import deque
 from datetime import datetime
-from typing import List, Dict, Optional
-from config import SESSION_DIR
+from typing import Iterable, List, Dict, Optional
+from config import SESSION_DIR, DB_FLUSH_INTERVAL
 
 logger = logging.getLogger(__name__)
 
+# Prefer orjson for (de)serialization when it is installed
+try:
+    import orjson
+
+    def _dumps(data) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+
+    def _dumps_line(data) -> bytes:
+        return orjson.dumps(data) + b'\n'
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(data) -> bytes:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+    def _dumps_line(data) -> bytes:
+        return (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+
+    _loads = json.loads
+
+# Characters stripped from phone numbers before they are used as keys
+_PHONE_STRIP = str.maketrans('', '', '+- ')
+
+def canonical_phone(phone_number: str) -> str:
+    """Normalize a phone number to its interned '+digits' form"""
+    return sys.intern('+' + phone_number.translate(_PHONE_STRIP))
+
 class DatabaseManager:
     def __init__(self):
         self.data_dir = "data"
         self.accounts_file = os.path.join(self.data_dir, "accounts.json")
         self.usernames_file = os.path.join(self.data_dir, "usernames.json")
         self.config_file = os.path.join(self.data_dir, "config.json")
-        self.sniped_file = os.path.join(self.data_dir, "sniped_history.json")
+        self.sniped_file = os.path.join(self.data_dir, "sniped_history.jsonl")
+        self.legacy_sniped_file = os.path.join(self.data_dir, "sniped_history.json")
+
+        # Parsed JSON files kept in memory, written back lazily
+        self._cache = {}
+        self._dirty = set()
+        self._flush_handle = None
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+
         self.init_json_files()
 
+        # Lookup indices over the cached lists, sharing the same record objects
+        self._accounts_by_phone = {canonical_phone(a['phone_number']): a for a in self._get(self.accounts_file, [])}
+        self._usernames_by_name = {u['username']: u for u in self._get(self.usernames_file, [])}
+
+        # Bumped whenever the monitored username list changes
+        self._usernames_version = 0
+
     def init_json_files(self):
         """Initialize JSON files with required structure"""
         try:
@@ -42,9 +89,12 @@ class DatabaseManager:
                 }
                 self._save_json(self.config_file, default_config)
 
-            # Initialize sniped_history.json
+            # Initialize sniped_history.jsonl, migrating the old JSON history if present
             if not os.path.exists(self.sniped_file):
-                self._save_json(self.sniped_file, [])
+                legacy_history = self._load_json(self.legacy_sniped_file, [])
+                with open(self.sniped_file, 'wb') as f:
+                    for entry in legacy_history:
+                        f.write(_dumps_line(entry))
 
             logger.info("JSON data files initialized successfully")
 
@@ -55,33 +105,100 @@ class DatabaseManager:
     def _load_json(self, file_path: str, default=None):
         """Load data from JSON file"""
         try:
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            with open(file_path, 'rb') as f:
+                return _loads(f.read())
+        except FileNotFoundError:
             return default if default is not None else []
         except Exception as e:
             logger.error(f"Error loading JSON from {file_path}: {e}")
             return default if default is not None else []
 
     def _save_json(self, file_path: str, data):
-        """Save data to JSON file"""
+        """Save data to JSON file atomically"""
+        self._write_bytes(file_path, _dumps(data))
+
+    def _write_bytes(self, file_path: str, payload: bytes):
+        """Atomically replace a file with already serialized content"""
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Write to a temp file and swap it in so readers never see a partial file
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
         except Exception as e:
             logger.error(f"Error saving JSON to {file_path}: {e}")
             raise
 
+    def _get(self, file_path: str, default=None):
+        """Get cached data for a JSON file, loading it on first access"""
+        if file_path not in self._cache:
+            self._cache[file_path] = self._load_json(file_path, default)
+        return self._cache[file_path]
+
+    def _mark_dirty(self, file_path: str):
+        """Mark a cached file as modified and schedule a flush"""
+        self._dirty.add(file_path)
+
+        if self._flush_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop running, write immediately
+            self.flush()
+            return
+
+        self._flush_handle = loop.call_later(DB_FLUSH_INTERVAL, self._start_flush)
+
+    def _start_flush(self):
+        """Timer callback that runs the flush in a background task"""
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self.flush_async())
+
+    async def flush_async(self):
+        """Write all modified files to disk without blocking the event loop"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        async with self._flush_lock:
+            # Serialize on the loop thread so the cache is never read concurrently
+            payloads = [(file_path, _dumps(self._cache[file_path])) for file_path in self._dirty]
+            self._dirty.clear()
+
+            for file_path, payload in payloads:
+                try:
+                    await asyncio.to_thread(self._write_bytes, file_path, payload)
+                except Exception as e:
+                    logger.error(f"Error flushing {file_path}: {e}")
+                    self._mark_dirty(file_path)
+
+    def flush(self):
+        """Write all modified files to disk, blocking until done"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        for file_path in list(self._dirty):
+            try:
+                self._save_json(file_path, self._cache[file_path])
+                self._dirty.discard(file_path)
+            except Exception as e:
+                logger.error(f"Error flushing {file_path}: {e}")
+
     def add_account(self, phone_number: str, session_name: str) -> bool:
         """Add a new account to the JSON file"""
+        phone_number = canonical_phone(phone_number)
         try:
-            accounts = self._load_json(self.accounts_file, [])
+            accounts = self._get(self.accounts_file, [])
 
             # Check if account already exists
-            for account in accounts:
-                if account.get('phone_number') == phone_number:
-                    logger.warning(f"Account {phone_number} already exists")
-                    return False
+            if phone_number in self._accounts_by_phone:
+                logger.warning(f"Account {phone_number} already exists")
+                return False
 
             # Add new account
             new_account = {
@@ -91,7 +208,8 @@ class DatabaseManager:
                 "added_timestamp": datetime.now().isoformat()
             }
             accounts.append(new_account)
-            self._save_json(self.accounts_file, accounts)
+            self._accounts_by_phone[phone_number] = new_account
+            self._mark_dirty(self.accounts_file)
 
             logger.info(f"Added account: {phone_number}")
             return True
@@ -102,15 +220,13 @@ class DatabaseManager:
 
     def activate_account(self, phone_number: str) -> bool:
         """Activate an account"""
+        phone_number = canonical_phone(phone_number)
         try:
-            accounts = self._load_json(self.accounts_file, [])
+            account = self._accounts_by_phone.get(phone_number)
+            if account is not None:
+                account["is_active"] = True
 
-            for account in accounts:
-                if account["phone_number"] == phone_number:
-                    account["is_active"] = True
-                    break
-
-            self._save_json(self.accounts_file, accounts)
+            self._mark_dirty(self.accounts_file)
             logger.info(f"Activated account: {phone_number}")
             return True
 
@@ -120,15 +236,13 @@ class DatabaseManager:
 
     def deactivate_account(self, phone_number: str) -> bool:
         """Deactivate an account"""
+        phone_number = canonical_phone(phone_number)
         try:
-            accounts = self._load_json(self.accounts_file, [])
-
-            for account in accounts:
-                if account["phone_number"] == phone_number:
-                    account["is_active"] = False
-                    break
+            account = self._accounts_by_phone.get(phone_number)
+            if account is not None:
+                account["is_active"] = False
 
-            self._save_json(self.accounts_file, accounts)
+            self._mark_dirty(self.accounts_file)
             logger.info(f"Deactivated account: {phone_number}")
             return True
 
@@ -139,7 +253,7 @@ class DatabaseManager:
     def get_active_accounts(self) -> List[Dict]:
         """Get all active accounts"""
         try:
-            accounts = self._load_json(self.accounts_file, [])
+            accounts = self._get(self.accounts_file, [])
             return [{"phone": acc["phone_number"], "session": acc["session_name"]} 
                    for acc in accounts if acc.get("is_active", False)]
         except Exception as e:
@@ -149,7 +263,7 @@ class DatabaseManager:
     def get_all_accounts(self) -> List[Dict]:
         """Get all accounts"""
         try:
-            accounts = self._load_json(self.accounts_file, [])
+            accounts = self._get(self.accounts_file, [])
             return [{"phone": acc["phone_number"], "session": acc["session_name"], "active": acc.get("is_active", False)} 
                    for acc in accounts]
         except Exception as e:
@@ -159,14 +273,13 @@ class DatabaseManager:
     def add_username(self, username: str) -> bool:
         """Add a username to monitor"""
         try:
-            usernames = self._load_json(self.usernames_file, [])
+            usernames = self._get(self.usernames_file, [])
             clean_username = username.lstrip('@')
 
             # Check if username already exists
-            for user in usernames:
-                if user.get('username') == clean_username:
-                    logger.warning(f"Username {username} already exists")
-                    return False
+            if clean_username in self._usernames_by_name:
+                logger.warning(f"Username {username} already exists")
+                return False
 
             # Add new username
             new_username = {
@@ -176,7 +289,9 @@ class DatabaseManager:
                 "last_checked": None
             }
             usernames.append(new_username)
-            self._save_json(self.usernames_file, usernames)
+            self._usernames_by_name[clean_username] = new_username
+            self._usernames_version += 1
+            self._mark_dirty(self.usernames_file)
 
             logger.info(f"Added username: @{clean_username}")
             return True
@@ -188,18 +303,18 @@ class DatabaseManager:
     def remove_username(self, username: str) -> bool:
         """Remove a username from monitoring"""
         try:
-            usernames = self._load_json(self.usernames_file, [])
             clean_username = username.lstrip('@')
 
-            original_length = len(usernames)
-            usernames = [u for u in usernames if u.get('username') != clean_username]
-
-            if len(usernames) < original_length:
-                self._save_json(self.usernames_file, usernames)
-                logger.info(f"Removed username: @{clean_username}")
-                return True
+            user = self._usernames_by_name.pop(clean_username, None)
+            if user is None:
+                return False
 
-            return False
+            usernames = self._get(self.usernames_file, [])
+            usernames.remove(user)
+            self._usernames_version += 1
+            self._mark_dirty(self.usernames_file)
+            logger.info(f"Removed username: @{clean_username}")
+            return True
 
         except Exception as e:
             logger.error(f"Error removing username: {e}")
@@ -208,40 +323,52 @@ class DatabaseManager:
     def get_active_usernames(self) -> List[str]:
         """Get all active usernames to monitor"""
         try:
-            usernames = self._load_json(self.usernames_file, [])
+            usernames = self._get(self.usernames_file, [])
             return [u["username"] for u in usernames if u.get("is_active", True)]
         except Exception as e:
             logger.error(f"Error getting usernames: {e}")
             return []
 
+    def get_usernames_version(self) -> int:
+        """Get a counter that changes whenever usernames are added or removed"""
+        return self._usernames_version
+
     def update_username_check(self, username: str):
         """Update last checked timestamp for a username"""
+        self.update_username_checks([username])
+
+    def update_username_checks(self, usernames: Iterable[str], timestamp: str = None):
+        """Update last checked timestamp for several usernames at once"""
         try:
-            usernames = self._load_json(self.usernames_file, [])
+            timestamp = timestamp or datetime.now().isoformat()
+            updated = False
 
-            for user in usernames:
-                if user.get('username') == username:
-                    user['last_checked'] = datetime.now().isoformat()
-                    break
+            for username in usernames:
+                user = self._usernames_by_name.get(username)
+                if user is not None:
+                    user['last_checked'] = timestamp
+                    updated = True
 
-            self._save_json(self.usernames_file, usernames)
+            # Unknown usernames leave the file untouched
+            if updated:
+                self._mark_dirty(self.usernames_file)
 
         except Exception as e:
-            logger.error(f"Error updating username check: {e}")
+            logger.error(f"Error updating username checks: {e}")
 
     def set_config(self, key: str, value: str):
         """Set a configuration value"""
         try:
-            config = self._load_json(self.config_file, {})
+            config = self._get(self.config_file, {})
             config[key] = value
-            self._save_json(self.config_file, config)
+            self._mark_dirty(self.config_file)
         except Exception as e:
             logger.error(f"Error setting config: {e}")
 
     def get_config(self, key: str, default: str = None) -> Optional[str]:
         """Get a configuration value"""
         try:
-            config = self._load_json(self.config_file, {})
+            config = self._get(self.config_file, {})
             return config.get(key, default)
         except Exception as e:
             logger.error(f"Error getting config: {e}")
@@ -250,8 +377,6 @@ class DatabaseManager:
     def add_sniped_username(self, username: str, channel_link: str = None, account_used: str = None):
         """Add a sniped username to history"""
         try:
-            sniped_history = self._load_json(self.sniped_file, [])
-
             new_snipe = {
                 "username": username,
                 "channel_link": channel_link,
@@ -259,24 +384,40 @@ class DatabaseManager:
                 "account_used": account_used
             }
 
-            sniped_history.append(new_snipe)
-            self._save_json(self.sniped_file, sniped_history)
+            # Append-only log, one JSON record per line
+            with open(self.sniped_file, 'ab') as f:
+                f.write(_dumps_line(new_snipe))
 
             logger.info(f"Added sniped username to history: @{username}")
 
         except Exception as e:
             logger.error(f"Error adding sniped username: {e}")
 
+    def _iter_sniped_entries(self, lines):
+        """Parse sniped history lines, skipping the ones that are not valid records"""
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = _loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping malformed line {line_number} in {self.sniped_file}: {e}")
+                continue
+            if not isinstance(entry, dict) or "username" not in entry:
+                logger.warning(f"Skipping invalid record at line {line_number} in {self.sniped_file}")
+                continue
+            yield entry
+
     def get_sniped_usernames(self, limit: int = 50) -> List[Dict]:
         """Get history of sniped usernames"""
         try:
-            sniped_history = self._load_json(self.sniped_file, [])
-
-            # Sort by timestamp in descending order
-            sniped_history.sort(key=lambda x: x.get("sniped_timestamp", ""), reverse=True)
+            # Records are appended in order, so only the last entries are needed
+            with open(self.sniped_file, 'rb') as f:
+                last_entries = deque(self._iter_sniped_entries(f), maxlen=limit)
 
-            # Apply limit
-            limited_history = sniped_history[:limit]
+            # Newest first by timestamp, without sorting the whole list in place
+            limited_history = heapq.nlargest(limit, last_entries,
+                                             key=lambda x: x.get("sniped_timestamp", ""))
 
             return [{"username": entry["username"], 
                     "channel_link": entry.get("channel_link"), 
@@ -7,6 +7,7 @@ Main entry point for the userbot sniper system
 import asyncio
 import logging
 import os
+import sys
 from userbot import UserbotSniper
 
 # Configure logging
@@ -21,12 +22,25 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+def install_event_loop_policy():
+    """Use uvloop's faster event loop when it is available"""
+    if sys.platform == 'win32':
+        return
+    
+    try:
+        import uvloop
+    except ImportError:
+        return
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+
 async def main():
     """Main entry point"""
+    # Initialize the userbot sniper
+    sniper = UserbotSniper()
+    
     try:
-        # Initialize the userbot sniper
-        sniper = UserbotSniper()
-        
         logger.info("Starting Telegram Username Sniper Bot...")
         
         # Start the bot
@@ -40,6 +54,11 @@ async def main():
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
         raise
+    
+    finally:
+        # Also runs on Ctrl-C, so pending database changes are flushed
+        await sniper.disconnect()
 
 if __name__ == "__main__":
+    install_event_loop_policy()
     asyncio.run(main())
@@ -9,14 +9,21 @@ from typing import Optional
 from telethon import TelegramClient, events
 from telethon.tl.types import User
 
-from config import API_ID, API_HASH, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, MIN_PAIR_DELAY, MAX_PAIR_DELAY
-from database import DatabaseManager
+from config import (API_ID, API_HASH, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, MIN_PAIR_DELAY, MAX_PAIR_DELAY,
+                    MAX_HOT_USERNAMES)
+from database import DatabaseManager, canonical_phone
 from account_manager import AccountManager
 from username_monitor import UsernameMonitor
 from channel_creator import ChannelCreator
 
 logger = logging.getLogger(__name__)
 
+# Precompiled command patterns
+_COMMAND_RE = re.compile(r'^\.(\w+)(?:\s+(.*))?$', re.DOTALL)
+_PHONE_RE = re.compile(r'^\+\d{1,15}$')
+_USERNAME_ARG_RE = re.compile(r'@?\w+')
+_INT_ARG_RE = re.compile(r'\d+')
+
 class UserbotSniper:
     def __init__(self):
         # Initialize components
@@ -28,6 +35,21 @@ class UserbotSniper:
         # Main userbot client (the one that receives commands)
         self.main_client = None
         self.authorized_user_id = None
+        
+        # Command name -> handler, filled in by register_handlers
+        self._commands = {}
+        
+        # Monitoring settings, refreshed only when changed by a command
+        self._config_cache = {}
+        self._refresh_config_cache()
+    
+    def _refresh_config_cache(self):
+        """Reload the cached monitoring settings from the database"""
+        self._config_cache = {
+            'check_interval': self.db.get_config('check_interval', '30'),
+            'pair_delay': self.db.get_config('pair_delay', '60'),
+            'hot_username_count': self.db.get_config('hot_username_count', '0')
+        }
     
     async def start(self):
         """Start the userbot system"""
@@ -62,21 +84,21 @@ class UserbotSniper:
     def register_handlers(self):
         """Register command handlers"""
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.new (.+)', outgoing=True))
-        async def handle_new_account(event):
-            phone = event.pattern_match.group(1).strip()
+        async def handle_new_account(event, arg_str):
+            phone = arg_str.strip()
             
             # Validate phone number format
-            if not re.match(r'^\+\d{1,15}$', phone):
+            if not _PHONE_RE.match(phone):
                 await event.edit("❌ Formato numero non valido. Usa formato: +1234567890")
                 return
             
             success, message = await self.account_manager.add_new_account(phone)
             await event.edit(f"📱 {message}")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.code (.+)', outgoing=True))
-        async def handle_verify_code(event):
-            code = event.pattern_match.group(1).strip()
+        async def handle_verify_code(event, arg_str):
+            code = arg_str.strip()
+            if not code:
+                return
             
             # Get the last pending session (assuming user adds one at a time)
             if not self.account_manager.pending_sessions:
@@ -84,127 +106,129 @@ class UserbotSniper:
                 return
             
             # Get the first pending session
-            phone = list(self.account_manager.pending_sessions.keys())[0]
+            phone = next(iter(self.account_manager.pending_sessions))
             
             success, message = await self.account_manager.verify_code(phone, code)
             await event.edit(f"🔐 {message}")
-            
-            # If verification was successful, reload sessions
-            if success:
-                await self.account_manager.load_existing_sessions()
-                logger.info("Account list reloaded after successful verification")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.voip', outgoing=True))
-        async def handle_list_accounts(event):
+        async def handle_list_accounts(event, arg_str):
             accounts = self.db.get_all_accounts()
             
             if not accounts:
                 await event.edit("📱 Nessun account configurato.")
                 return
             
-            message = "📱 **Account Configurati:**\n\n"
+            parts = ["📱 **Account Configurati:**\n\n"]
             for i, account in enumerate(accounts, 1):
                 status = "✅ Attivo" if account['active'] else "⏳ In attesa"
-                message += f"{i}. {account['phone']} - {status}\n"
+                parts.append(f"{i}. {account['phone']} - {status}\n")
             
-            await event.edit(message)
+            await event.edit("".join(parts))
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.delvoip (.+)', outgoing=True))
-        async def handle_remove_account(event):
-            phone = event.pattern_match.group(1).strip()
-            
-            # Add + if not present
-            if not phone.startswith('+'):
-                phone = '+' + phone
-            
-            # Check if account exists
-            if phone not in self.account_manager.clients:
-                await event.edit(f"❌ Account {phone} non trovato o non attivo")
+        async def handle_remove_account(event, arg_str):
+            phone = arg_str.strip()
+            if not phone:
                 return
             
+            # Normalize to the '+digits' form used as account key
+            phone = canonical_phone(phone)
+            
             try:
-                # Disconnect the client
-                client = self.account_manager.clients[phone]
-                await client.disconnect()
-                
-                # Remove from active clients
-                del self.account_manager.clients[phone]
-                
-                # Deactivate in database
-                self.db.deactivate_account(phone)
-                
-                await event.edit(f"✅ Account {phone} rimosso dal monitoraggio e disconnesso")
-                logger.info(f"Account {phone} removed from monitoring")
-                
-                # Reload existing sessions to get updated active accounts
-                await self.account_manager.load_existing_sessions()
-                logger.info("Account list reloaded after removal")
+                success, message = await self.account_manager.remove_account(phone)
+                await event.edit(f"✅ {message}" if success else f"❌ {message}")
                 
             except Exception as e:
                 logger.error(f"Error removing account {phone}: {e}")
                 await event.edit(f"❌ Errore rimuovendo account {phone}: {str(e)}")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.addusername (@?\w+)', outgoing=True))
-        async def handle_add_username(event):
-            username = event.pattern_match.group(1).strip()
+        async def handle_reload_accounts(event, arg_str):
+            await self.account_manager.load_existing_sessions()
+            await event.edit(f"🔄 Sessioni ricaricate: {len(self.account_manager.clients)} account attivi")
+            logger.info("Account list reloaded on request")
+        
+        async def handle_add_username(event, arg_str):
+            match = _USERNAME_ARG_RE.match(arg_str)
+            if not match:
+                return
+            username = match.group(0)
             
             if self.db.add_username(username):
                 await event.edit(f"✅ Username {username} aggiunto alla lista di monitoraggio")
             else:
                 await event.edit(f"❌ Username {username} già presente o errore")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.delusername (@?\w+)', outgoing=True))
-        async def handle_del_username(event):
-            username = event.pattern_match.group(1).strip()
+        async def handle_del_username(event, arg_str):
+            match = _USERNAME_ARG_RE.match(arg_str)
+            if not match:
+                return
+            username = match.group(0)
             
             if self.db.remove_username(username):
                 await event.edit(f"✅ Username {username} rimosso dalla lista di monitoraggio")
             else:
                 await event.edit(f"❌ Username {username} non trovato nella lista")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.lista', outgoing=True))
-        async def handle_list_usernames(event):
+        async def handle_list_usernames(event, arg_str):
             usernames = self.db.get_active_usernames()
             
             if not usernames:
                 await event.edit("📝 Nessun username in monitoraggio.")
                 return
             
-            message = "📝 **Username Monitorati:**\n\n"
+            parts = ["📝 **Username Monitorati:**\n\n"]
             for i, username in enumerate(usernames, 1):
-                message += f"{i}. @{username}\n"
+                parts.append(f"{i}. @{username}\n")
             
-            await event.edit(message)
+            await event.edit("".join(parts))
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.setime (\d+)', outgoing=True))
-        async def handle_set_time(event):
-            interval = int(event.pattern_match.group(1))
+        async def handle_set_time(event, arg_str):
+            match = _INT_ARG_RE.match(arg_str)
+            if not match:
+                return
+            interval = int(match.group(0))
             
             if interval < MIN_CHECK_INTERVAL or interval > MAX_CHECK_INTERVAL:
                 await event.edit(f"❌ L'intervallo deve essere tra {MIN_CHECK_INTERVAL} e {MAX_CHECK_INTERVAL} secondi")
                 return
             
             self.db.set_config('check_interval', str(interval))
+            self._refresh_config_cache()
             await event.edit(f"⏰ Intervallo di controllo impostato a {interval} secondi")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.coppia (\d+)', outgoing=True))
-        async def handle_set_pair_delay(event):
-            delay = int(event.pattern_match.group(1))
+        async def handle_set_pair_delay(event, arg_str):
+            match = _INT_ARG_RE.match(arg_str)
+            if not match:
+                return
+            delay = int(match.group(0))
             
             if delay < MIN_PAIR_DELAY or delay > MAX_PAIR_DELAY:
                 await event.edit(f"❌ Il ritardo coppia deve essere tra {MIN_PAIR_DELAY} e {MAX_PAIR_DELAY} secondi")
                 return
             
             self.db.set_config('pair_delay', str(delay))
+            self._refresh_config_cache()
             await event.edit(f"⏰ Ritardo coppia impostato a {delay} secondi")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.start', outgoing=True))
-        async def handle_start_monitoring(event):
+        async def handle_set_hot_count(event, arg_str):
+            match = _INT_ARG_RE.match(arg_str)
+            if not match:
+                return
+            count = int(match.group(0))
+            
+            if count > MAX_HOT_USERNAMES:
+                await event.edit(f"❌ Gli username caldi devono essere tra 0 e {MAX_HOT_USERNAMES}")
+                return
+            
+            self.db.set_config('hot_username_count', str(count))
+            self._refresh_config_cache()
+            await event.edit(f"🔥 I primi {count} username saranno controllati da tutti gli account")
+        
+        async def handle_start_monitoring(event, arg_str):
             if self.username_monitor.is_monitoring():
                 await event.edit("⚡ Il monitoraggio è già attivo!")
                 return
             
-            clients = self.account_manager.get_active_clients()
+            clients = self.account_manager.iter_active_clients()
             if not clients:
                 await event.edit("❌ Nessun account attivo disponibile per il monitoraggio")
                 return
@@ -219,8 +243,7 @@ class UserbotSniper:
             # Start monitoring in background
             asyncio.create_task(self.start_monitoring_loop())
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.stop', outgoing=True))
-        async def handle_stop_monitoring(event):
+        async def handle_stop_monitoring(event, arg_str):
             if not self.username_monitor.is_monitoring():
                 await event.edit("⏹️ Il monitoraggio non è attivo")
                 return
@@ -228,14 +251,14 @@ class UserbotSniper:
             self.username_monitor.stop_monitoring()
             await event.edit("⏹️ Monitoraggio fermato")
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.status', outgoing=True))
-        async def handle_status(event):
-            clients = self.account_manager.get_active_clients()
+        async def handle_status(event, arg_str):
+            clients = self.account_manager.iter_active_clients()
             usernames = self.db.get_active_usernames()
             is_monitoring = self.username_monitor.is_monitoring()
             
-            check_interval = self.db.get_config('check_interval', '30')
-            pair_delay = self.db.get_config('pair_delay', '60')
+            check_interval = self._config_cache['check_interval']
+            pair_delay = self._config_cache['pair_delay']
+            hot_count = self._config_cache['hot_username_count']
             
             status = "📊 **Stato Sniper:**\n\n"
             status += f"🤖 Account Attivi: {len(clients)}\n"
@@ -243,31 +266,30 @@ class UserbotSniper:
             status += f"⚡ Monitoraggio: {'✅ Attivo' if is_monitoring else '⏹️ Fermo'}\n"
             status += f"⏰ Intervallo Controlli: {check_interval}s\n"
             status += f"🔄 Ritardo Coppie: {pair_delay}s\n"
+            status += f"🔥 Username Caldi: {hot_count}\n"
             
             await event.edit(status)
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.sniperati', outgoing=True))
-        async def handle_sniped_history(event):
+        async def handle_sniped_history(event, arg_str):
             sniped = self.db.get_sniped_usernames(20)  # Show last 20
             
             if not sniped:
                 await event.edit("📋 Nessun username sniperato finora.")
                 return
             
-            message = "📋 **Username Sniperati:**\n\n"
+            parts = ["📋 **Username Sniperati:**\n\n"]
             for i, entry in enumerate(sniped, 1):
                 timestamp = entry['timestamp'].split('.')[0] if entry['timestamp'] else "N/A"
                 account = entry['account'] or "N/A"
                 link = entry['channel_link'] or f"@{entry['username']}"
-                message += f"{i}. @{entry['username']}\n"
-                message += f"   📅 {timestamp}\n"
-                message += f"   🤖 Account: {account}\n"
-                message += f"   🔗 {link}\n\n"
+                parts.append(f"{i}. @{entry['username']}\n"
+                             f"   📅 {timestamp}\n"
+                             f"   🤖 Account: {account}\n"
+                             f"   🔗 {link}\n\n")
             
-            await event.edit(message)
+            await event.edit("".join(parts))
         
-        @self.main_client.on(events.NewMessage(pattern=r'\.help', outgoing=True))
-        async def handle_help(event):
+        async def handle_help(event, arg_str):
             help_text = """
 🤖 **Bot Sniper Username Telegram**
 
@@ -276,6 +298,7 @@ class UserbotSniper:
 `.code 12345` - Verifica account con codice
 `.voip` - Lista di tutti gli account
 `.delvoip +1234567890` - Rimuovi account dal monitoraggio
+`.reload` - Ricarica le sessioni degli account attivi
 
 **Gestione Username:**
 `.addusername @username` - Aggiungi username da monitorare
@@ -286,6 +309,7 @@ class UserbotSniper:
 **Configurazione:**
 `.setime 30` - Imposta intervallo controlli (5-300 secondi)
 `.coppia 60` - Imposta ritardo coppie (10-600 secondi)
+`.hot 2` - Controlla i primi N username con tutti gli account (0-10)
 
 **Controllo:**
 `.start` - Avvia monitoraggio
@@ -294,11 +318,37 @@ class UserbotSniper:
 `.help` - Mostra questo aiuto
             """
             await event.edit(help_text)
+        
+        # Route every command through a single handler instead of one pattern each
+        self._commands = {
+            "new": handle_new_account,
+            "code": handle_verify_code,
+            "voip": handle_list_accounts,
+            "delvoip": handle_remove_account,
+            "reload": handle_reload_accounts,
+            "addusername": handle_add_username,
+            "delusername": handle_del_username,
+            "lista": handle_list_usernames,
+            "setime": handle_set_time,
+            "coppia": handle_set_pair_delay,
+            "hot": handle_set_hot_count,
+            "start": handle_start_monitoring,
+            "stop": handle_stop_monitoring,
+            "status": handle_status,
+            "sniperati": handle_sniped_history,
+            "help": handle_help,
+        }
+        
+        @self.main_client.on(events.NewMessage(pattern=_COMMAND_RE, outgoing=True))
+        async def dispatch_command(event):
+            handler = self._commands.get(event.pattern_match.group(1))
+            if handler:
+                await handler(event, event.pattern_match.group(2) or "")
     
     async def auto_start_monitoring(self):
         """Auto-start monitoring if conditions are met"""
         try:
-            clients = self.account_manager.get_active_clients()
+            clients = self.account_manager.iter_active_clients()
             usernames = self.db.get_active_usernames()
             
             if clients and usernames and not self.username_monitor.is_monitoring():
@@ -317,14 +367,15 @@ class UserbotSniper:
                 logger.info(f"🎯 Found available username: @{username}")
                 
                 # Try to create channel
-                success, message, channel_link = await self.channel_creator.create_channel_with_fallback(clients, username)
+                result = await self.channel_creator.create_channel_with_fallback(
+                    self.account_manager.iter_active_clients(), username
+                )
+                message = result.message
                 
                 # If channel was created successfully, remove username from monitoring list and add to history
-                if success:
+                if result.success:
                     self.db.remove_username(username)
-                    # Extract account used from message
-                    account_used = message.split("usando ")[1].split(":")[0] if "usando " in message else "Unknown"
-                    self.db.add_sniped_username(username, channel_link, account_used)
+                    self.db.add_sniped_username(username, result.channel_link, result.account)
                     logger.info(f"✅ Username @{username} removed from monitoring list after successful snipe")
                     message += f"\n\n✅ Username @{username} rimosso dalla lista di monitoraggio"
                 
@@ -349,7 +400,16 @@ class UserbotSniper:
     async def disconnect(self):
         """Disconnect all clients"""
         try:
+            # Cancel monitoring and let it unwind before disconnecting its clients
+            monitor_task = self.username_monitor.monitor_task
             self.username_monitor.stop_monitoring()
+            if monitor_task is not None:
+                try:
+                    await monitor_task
+                except asyncio.CancelledError:
+                    pass
+            # Snipes in progress still need their clients to record the claim
+            await self.username_monitor.wait_found_callbacks()
             await self.account_manager.disconnect_all()
             if self.main_client:
                 await self.main_client.disconnect()
@@ -4,122 +4,303 @@ Username availability monitor
 
 import asyncio
 import logging
-from typing import List, Dict, Tuple
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Sequence, Tuple
 from telethon import TelegramClient
-from telethon.errors import UsernameNotOccupiedError, FloodWaitError
+from telethon.errors import UsernameNotOccupiedError, UsernameInvalidError, FloodWaitError
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from config import MAX_CONCURRENT_CHECKS, HOT_CHECK_TIMEOUT, MIN_CHECK_INTERVAL
 from database import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+# Maximum usernames shown when logging a list
+_LOG_PREVIEW = 10
+
+def _preview(usernames: Sequence[str]) -> str:
+    """Format at most _LOG_PREVIEW usernames for a log line"""
+    if len(usernames) <= _LOG_PREVIEW:
+        return str(list(usernames))
+    return f"{list(usernames[:_LOG_PREVIEW])} … (+{len(usernames) - _LOG_PREVIEW})"
+
+@dataclass
+class DistPlan:
+    """Assignment of usernames to clients for one monitoring cycle"""
+    chunks: Dict[str, Sequence[str]]
+    active_phones: List[str]
+    alternating: Dict[str, int]  # phone of each alternating client -> round offset
+    sorted_usernames: Tuple[str, ...]
+    mode: str  # "normal" or "alternating"
+
+    def usernames_for(self, phone: str, round_counter: int) -> List[str]:
+        """Get the usernames a client should check in the given round"""
+        offset = self.alternating.get(phone)
+        if offset is not None:
+            # Alternating clients check a different username every round,
+            # offset from each other
+            username_index = (round_counter + offset) % len(self.sorted_usernames)
+            return [self.sorted_usernames[username_index]]
+        return list(self.chunks[phone])
+
 class UsernameMonitor:
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
-        self.monitoring = False
         self.monitor_task = None
+        # Username -> task running found_callback, not cancelled with monitoring
+        self.found_tasks: Dict[str, asyncio.Task] = {}
+        # Phone -> monotonic time when its last flood wait ends
+        self.flood_until: Dict[str, float] = {}
 
-    async def check_username_availability(self, client: TelegramClient, username: str) -> bool:
+    async def check_username_availability(self, client: TelegramClient, username: str,
+                                          phone: Optional[str] = None) -> bool:
         """Check if a username is available"""
+        return bool(await self.probe_username(client, username, phone))
+
+    async def probe_username(self, client: TelegramClient, username: str, phone: Optional[str] = None,
+                             wait_flood: bool = True) -> Optional[bool]:
+        """Check a username, returning None when the client could not tell
+
+        Flood waits are recorded for ``phone`` and only slept through when
+        ``wait_flood`` is set.
+        """
         try:
-            # Try to get entity by username
-            await client.get_entity(f"@{username}")
+            # Resolve the username directly, skipping entity cache lookups
+            await client(ResolveUsernameRequest(username=username))
             return False  # Username is taken
         except UsernameNotOccupiedError:
             return True   # Username is available
+        except UsernameInvalidError:
+            # Telegram will never assign it, sniping would only fail on every round
+            logger.debug("Username @%s is invalid", username)
+            return False
         except FloodWaitError as e:
             logger.warning(f"Flood wait error: {e.seconds} seconds")
-            await asyncio.sleep(e.seconds)
-            return False
-        except ValueError as e:
-            # Check if it's the "No user has X as username" error which means it's available
-            if "No user has" in str(e) and "as username" in str(e):
-                logger.info(f"Username @{username} is available!")
-                return True
-            logger.error(f"ValueError checking username @{username}: {e}")
-            return False
+            if phone is not None:
+                self.flood_until[phone] = time.monotonic() + e.seconds
+            if wait_flood:
+                await asyncio.sleep(e.seconds)
+            return None
         except Exception as e:
-            # Check for other indicators that username is available
-            error_msg = str(e).lower()
-            if any(indicator in error_msg for indicator in ["no user", "not found", "does not exist"]):
-                logger.info(f"Username @{username} appears to be available (error: {e})")
-                return True
             logger.error(f"Error checking username @{username}: {e}")
-            return False
+            return None
 
-    def distribute_usernames(self, usernames: List[str], client_count: int) -> List[List[str]]:
+    def distribute_usernames(self, usernames: List[str],
+                             client_list: List[Tuple[str, TelegramClient]]) -> DistPlan:
         """Distribute usernames among available clients"""
-        if client_count == 0:
-            return []
-
-        if len(usernames) == 0:
-            return [[] for _ in range(client_count)]
-
         # Sort usernames for consistent distribution
-        sorted_usernames = sorted(usernames)
-        chunks = [[] for _ in range(client_count)]
+        sorted_usernames = tuple(sorted(usernames))
+        phones = [phone for phone, _ in client_list]
+        client_count = len(phones)
+        chunks: Dict[str, Sequence[str]] = {phone: [] for phone in phones}
+        alternating: Dict[str, int] = {}
+        mode = "alternating" if 0 < len(usernames) < client_count else "normal"
+
+        if client_count == 0 or len(usernames) == 0:
+            return DistPlan(chunks, [], alternating, sorted_usernames, mode)
 
-        if len(usernames) >= client_count:
+        if mode == "normal":
             # Più username che client: distribuzione round-robin normale
             for i, username in enumerate(sorted_usernames):
-                client_index = i % client_count
-                chunks[client_index].append(username)
+                chunks[phones[i % client_count]].append(username)
         else:
             # Più client che username: ogni username va a un client diverso, 
             # poi i client rimanenti alternano tra tutti gli username
             
             # Prima assegna 1 username per client (fino agli username disponibili)
-            for i, username in enumerate(sorted_usernames):
-                chunks[i].append(username)
+            for phone, username in zip(phones, sorted_usernames):
+                chunks[phone].append(username)
             
-            # I client rimanenti ricevono tutti gli username per alternare
-            for client_index in range(len(usernames), client_count):
-                chunks[client_index] = sorted_usernames.copy()
+            # I client rimanenti condividono una sola tupla di sola lettura per alternare
+            for offset, phone in enumerate(phones[len(usernames):], len(usernames)):
+                chunks[phone] = sorted_usernames
+                alternating[phone] = offset
 
         # Log detailed distribution
         logger.info(f"📋 Distribuzione dettagliata di {len(usernames)} username tra {client_count} client:")
-        for i, chunk in enumerate(chunks):
-            if chunk:
-                logger.info(f"  Client {i+1}: {len(chunk)} username → {chunk}")
-            else:
-                logger.info(f"  Client {i+1}: 0 username → []")
+        if logger.isEnabledFor(logging.INFO):
+            for phone, chunk in chunks.items():
+                if phone in alternating:
+                    continue
+                logger.info("  %s: %d username → %s", phone, len(chunk), _preview(chunk))
 
-        return chunks
+        if alternating:
+            logger.info(f"  {len(alternating)} client alternanti su {len(usernames)} username")
+
+        active_phones = [phone for phone, chunk in chunks.items() if chunk]
+        return DistPlan(chunks, active_phones, alternating, sorted_usernames, mode)
 
     async def monitor_username_batch(self, client: TelegramClient, usernames: List[str],
-                                   check_interval: int, client_id: str) -> List[str]:
-        """Monitor a batch of usernames with one client"""
+                                   check_interval: int, client_id: str,
+                                   checked: Optional[List[str]] = None) -> List[str]:
+        """Monitor a batch of usernames with one client
+
+        Checked usernames are appended to ``checked`` when given, so the caller
+        can record them together; otherwise they are saved right away.
+        """
         available_usernames = []
+        checked_usernames = [] if checked is None else checked
 
-        logger.info(f"Client {client_id} monitoring {len(usernames)} usernames: {usernames}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Client %s monitoring %d usernames: %s", client_id, len(usernames), _preview(usernames))
 
-        for username in usernames:
-            try:
-                if await self.check_username_availability(client, username):
-                    logger.info(f"🎯 FOUND AVAILABLE: @{username}")
-                    available_usernames.append(username)
-                else:
-                    logger.debug(f"Username @{username} is taken")
+        # Check concurrently, but cap in-flight requests so one client is not flooded
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
 
-                # Update last checked in database
-                self.db.update_username_check(username)
+        async def check(username: str) -> bool:
+            async with semaphore:
+                return await self.check_username_availability(client, username, client_id)
 
-                # Wait between checks
-                if check_interval > 0:
-                    await asyncio.sleep(check_interval)
+        results = await asyncio.gather(*[check(username) for username in usernames],
+                                       return_exceptions=True)
 
-            except Exception as e:
-                logger.error(f"Error monitoring @{username}: {e}")
+        for username, result in zip(usernames, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error monitoring @{username}: {result}")
                 continue
 
+            if result:
+                logger.info(f"🎯 FOUND AVAILABLE: @{username}")
+                available_usernames.append(username)
+            else:
+                logger.debug("Username @%s is taken", username)
+
+            checked_usernames.append(username)
+
+        # Update last checked in database once for the whole batch
+        if checked is None and checked_usernames:
+            self.db.update_username_checks(checked_usernames)
+
+        # Wait once per batch instead of between every check
+        if check_interval > 0:
+            await asyncio.sleep(check_interval)
+
         return available_usernames
 
+    async def _client_round(self, phone: str, client: TelegramClient, usernames_to_check: List[str],
+                            check_interval: int, is_alternating: bool = False,
+                            checked: Optional[List[str]] = None) -> List[str]:
+        """Run one client's batch for the current round and return the usernames found"""
+        if logger.isEnabledFor(logging.INFO):
+            alternating_info = " (alternante)" if is_alternating else ""
+            logger.info("🔄 Turno di %s%s - Controllando %d username: %s",
+                        phone, alternating_info, len(usernames_to_check), _preview(usernames_to_check))
+
+        try:
+            return await self.monitor_username_batch(
+                client, usernames_to_check, check_interval, phone, checked
+            )
+        except Exception as e:
+            logger.error(f"Error in client {phone}: {e}")
+            return []
+
+    async def race_username_check(self, client_list: List[Tuple[str, TelegramClient]], username: str) -> bool:
+        """Check one username with every client at once, stopping at the first that sees it free"""
+        # Flood-waited clients sit out the race instead of extending their wait
+        now = time.monotonic()
+        ready = [(phone, client) for phone, client in client_list
+                 if self.flood_until.get(phone, 0) <= now]
+        if not ready:
+            logger.warning(f"Tutti i client sono in flood wait, salto @{username}")
+            return False
+
+        tasks = [asyncio.create_task(self.probe_username(client, username, phone, wait_flood=False))
+                 for phone, client in ready]
+        answered = 0
+
+        try:
+            # A failing client cannot hide the result, wait for the others
+            for probe in asyncio.as_completed(tasks, timeout=HOT_CHECK_TIMEOUT):
+                try:
+                    result = await probe
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error racing @{username}: {e}")
+                    continue
+
+                if result:
+                    return True
+                if result is not None:
+                    answered += 1
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout racing @{username}: {answered}/{len(tasks)} client hanno risposto")
+            return False
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if not answered:
+            logger.warning(f"Nessun client ha potuto controllare @{username}")
+        return False
+
+    async def _hot_loop(self, client_list: List[Tuple[str, TelegramClient]], hot_usernames: List[str],
+                        check_interval: int, found_callback=None):
+        """Race the hot usernames across all clients, independently of the regular rounds"""
+        while True:
+            logger.info("🔥 Controllo %d username con tutti i %d client", len(hot_usernames), len(client_list))
+
+            try:
+                results = await asyncio.gather(
+                    *[self.race_username_check(client_list, username) for username in hot_usernames],
+                    return_exceptions=True
+                )
+                self.db.update_username_checks(hot_usernames)
+
+                found = []
+                for username, result in zip(hot_usernames, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Error racing @{username}: {result}")
+                    elif result:
+                        logger.info(f"🎯 FOUND AVAILABLE: @{username}")
+                        found.append(username)
+
+                if found and found_callback:
+                    await self._report_found(found, found_callback)
+
+            except Exception as e:
+                logger.error(f"Error in hot username loop: {e}")
+
+            await asyncio.sleep(max(check_interval, MIN_CHECK_INTERVAL))
+
+    async def _report_found(self, usernames: List[str], found_callback):
+        """Run found_callback once per username and wait for the snipes to finish
+
+        The callbacks run in their own tasks, so stopping the monitor cannot
+        interrupt a snipe after the username has been claimed.
+        """
+        tasks = []
+        for username in dict.fromkeys(usernames):
+            if username in self.found_tasks:
+                continue
+            task = asyncio.create_task(found_callback(username))
+            task.add_done_callback(lambda _, username=username: self.found_tasks.pop(username, None))
+            self.found_tasks[username] = task
+            tasks.append((username, task))
+
+        if not tasks:
+            return
+
+        await asyncio.wait([task for _, task in tasks])
+        for username, task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Error handling found username @{username}: {task.exception()}")
+
+    async def wait_found_callbacks(self):
+        """Wait for snipes started by the monitor that are still running"""
+        if self.found_tasks:
+            await asyncio.gather(*self.found_tasks.values(), return_exceptions=True)
+
     async def start_monitoring(self, clients: Dict[str, TelegramClient],
                              found_callback=None) -> None:
         """Start monitoring usernames with multiple clients in pairs"""
-        if self.monitoring:
+        if self.is_monitoring():
             logger.warning("Monitoring already running")
             return
 
-        self.monitoring = True
+        # The task running this coroutine is cancelled to stop monitoring
+        self.monitor_task = asyncio.current_task()
         logger.info("Starting username monitoring...")
 
         # Filter out disconnected clients
@@ -149,13 +330,15 @@ class UsernameMonitor:
         # Get configuration
         check_interval = int(self.db.get_config('check_interval', '30'))
         pair_delay = int(self.db.get_config('pair_delay', '60'))
+        hot_count = int(self.db.get_config('hot_username_count', '0'))
 
         logger.info(f"Monitoring with {client_count} clients, "
                    f"check interval: {check_interval}s, pair delay: {pair_delay}s")
 
-        while self.monitoring:
+        while True:
             try:
                 # Get current usernames to monitor
+                usernames_version = self.db.get_usernames_version()
                 usernames = self.db.get_active_usernames()
 
                 if not usernames:
@@ -163,101 +346,107 @@ class UsernameMonitor:
                     await asyncio.sleep(30)
                     continue
 
+                # The first hot_count usernames are raced across all clients,
+                # the rest are distributed among them
+                hot_usernames = usernames[:hot_count]
+                regular_usernames = usernames[hot_count:]
+
+                if hot_usernames:
+                    logger.info(f"🔥 {len(hot_usernames)} username controllati da tutti i client: {hot_usernames}")
+
                 # Distribute usernames among clients
-                username_chunks = self.distribute_usernames(usernames, client_count)
+                plan = self.distribute_usernames(regular_usernames, client_list)
 
                 # Log distribution details
                 logger.info(f"📊 Distribuzione username tra {client_count} client:")
                 total_assigned = 0
-                for i, (phone, _) in enumerate(client_list):
-                    chunk = username_chunks[i] if i < len(username_chunks) else []
+                for phone, chunk in plan.chunks.items():
+                    if phone in plan.alternating:
+                        logger.info("  %s: alternante su %d username", phone, len(chunk))
+                        continue
                     total_assigned += len(chunk)
-                    logger.info(f"  {phone}: {len(chunk)} username → {chunk}")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("  %s: %d username → %s", phone, len(chunk), _preview(chunk))
 
                 # Verify all usernames are assigned
-                if total_assigned != len(usernames):
-                    logger.warning(f"⚠️ PROBLEMA DISTRIBUZIONE: {len(usernames)} username totali, "
+                if total_assigned != len(regular_usernames):
+                    logger.warning(f"⚠️ PROBLEMA DISTRIBUZIONE: {len(regular_usernames)} username totali, "
                                  f"ma solo {total_assigned} assegnati!")
                 else:
-                    logger.info(f"✅ Tutti i {len(usernames)} username sono stati assegnati correttamente")
+                    logger.info(f"✅ Tutti i {len(regular_usernames)} username sono stati assegnati correttamente")
 
-                # Work with clients sequentially (alternating) - use all clients that have usernames
-                active_client_indices = [i for i in range(client_count) if username_chunks[i]]
+                # Use all clients that have usernames
+                active_phones = plan.active_phones
 
-                if not active_client_indices:
+                if not active_phones and not hot_usernames:
                     logger.warning("No clients have usernames assigned")
                     await asyncio.sleep(30)
                     continue
 
                 # Count unique usernames vs total clients
-                unique_usernames = len(usernames)
-                total_clients = len(active_client_indices)
+                unique_usernames = len(regular_usernames)
+                total_clients = len(active_phones)
                 
-                if unique_usernames >= client_count:
+                if plan.mode == "normal":
                     logger.info(f"🎯 Usando tutti i {total_clients} client (distribuzione normale)")
                 else:
                     primary_clients = unique_usernames
                     alternating_clients = total_clients - primary_clients
                     logger.info(f"🎯 Usando {total_clients} client: {primary_clients} primari + {alternating_clients} alternanti")
 
-                current_index = 0
                 round_counter = 0
-                
-                while self.monitoring:
-                    # Get current active client
-                    client_index = active_client_indices[current_index]
-                    phone, client = client_list[client_index]
-                    chunk = username_chunks[client_index]
-
-                    # Determine what usernames this client should check
-                    if len(usernames) >= client_count:
-                        # Distribuzione normale: ogni client ha i suoi username fissi
-                        usernames_to_check = chunk
-                        is_alternating = False
-                    else:
-                        # Più client che username
-                        if client_index < len(usernames):
-                            # Client primario: controlla sempre lo stesso username
-                            usernames_to_check = [chunk[0]] if chunk else []
-                            is_alternating = False
-                        else:
-                            # Client alternante: controlla un username diverso ogni turno
-                            username_index = round_counter % len(usernames)
-                            usernames_to_check = [usernames[username_index]]
-                            is_alternating = True
-
-                    alternating_info = " (alternante)" if is_alternating else ""
-                    logger.info(f"🔄 Turno di {phone}{alternating_info} - Controllando {len(usernames_to_check)} username: {usernames_to_check}")
-
-                    # Check this client's usernames
-                    try:
-                        results = await self.monitor_username_batch(
-                            client, usernames_to_check, check_interval, phone
-                        )
-
-                        # Process any found usernames
-                        for username in results:
-                            if found_callback:
-                                await found_callback(username)
-
-                    except Exception as e:
-                        logger.error(f"Error in client {phone}: {e}")
-
-                    # Move to next active client (round-robin)
-                    current_index = (current_index + 1) % len(active_client_indices)
-
-                    # If we completed a full round, wait before starting next round
-                    if current_index == 0:
+
+                # Hot usernames get their own loop, a slow regular batch cannot delay them
+                hot_task = None
+                if hot_usernames:
+                    hot_task = asyncio.create_task(
+                        self._hot_loop(client_list, hot_usernames, check_interval, found_callback)
+                    )
+
+                try:
+                    while True:
+                        round_tasks = []
+                        round_checked = []
+                    
+                        for phone in active_phones:
+                            round_tasks.append(self._client_round(
+                                phone, active_clients[phone], plan.usernames_for(phone, round_counter),
+                                check_interval, phone in plan.alternating,
+                                round_checked
+                            ))
+
+                        # Run every client's batch for this round concurrently
+                        round_found = await asyncio.gather(*round_tasks)
+
+                        # Record every username checked this round in one update
+                        if round_checked:
+                            self.db.update_username_checks(round_checked)
+
+                        # Alternating clients may find the same username as a primary,
+                        # report each one only once per round
+                        if found_callback:
+                            await self._report_found(
+                                [username for names in round_found for username in names], found_callback
+                            )
+
+                        # Wait before starting next round
                         round_counter += 1
-                        if pair_delay > 0 and self.monitoring:
+                        if pair_delay > 0:
                             logger.info(f"🔄 Completato giro {round_counter}. Aspettando {pair_delay}s prima del prossimo giro...")
                             await asyncio.sleep(pair_delay)
 
                         # Re-check for username changes
-                        new_usernames = self.db.get_active_usernames()
-                        if new_usernames != usernames:
+                        if self.db.get_usernames_version() != usernames_version:
                             logger.info("📝 Lista username cambiata, ridistribuendo...")
                             break
+                finally:
+                    if hot_task is not None:
+                        hot_task.cancel()
+                        await asyncio.gather(hot_task, return_exceptions=True)
+
+            except asyncio.CancelledError:
+                logger.info("Username monitoring stopped")
+                raise
 
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
@@ -265,9 +454,10 @@ class UsernameMonitor:
 
     def stop_monitoring(self):
         """Stop the monitoring process"""
-        self.monitoring = False
-        logger.info("Stopping username monitoring...")
+        if self.is_monitoring():
+            logger.info("Stopping username monitoring...")
+            self.monitor_task.cancel()
 
     def is_monitoring(self) -> bool:
         """Check if monitoring is active"""
-        return self.monitoring
\ No newline at end of file
+        return self.monitor_task is not None and not self.monitor_task.done()
\ No newline at end of file